@@ -1,22 +1,106 @@
 # candidate_solution.py
 import sqlite3
 import os
+import re
+import string
+import json
+import random
+import time
+import asyncio
+import aiosqlite
 import httpx
-from fastapi import FastAPI, HTTPException, status
-from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request, status
+from typing import List, Optional, Tuple
 import uvicorn
 from datetime import datetime
+from contextlib import asynccontextmanager, closing
+from collections import OrderedDict
 
 # --- Constants ---
 DB_NAME = "pokemon_assessment.db"
 POKEAPI_BASE = "https://pokeapi.co/api/v2/pokemon"
+# In-process PokeAPI cache: entries kept, seconds for found / unknown names
+POKEAPI_CACHE_SIZE = 4096
+POKEAPI_CACHE_TTL = 3600
+POKEAPI_MISS_TTL = 300
+# Tables looked up by case-insensitive name in the API endpoints; each gets a
+# generated name_norm = LOWER(TRIM(name)) column at startup
+LOOKUP_TABLES = ["abilities", "types", "pokemon", "trainers"]
+# Number of connections kept open for the API endpoints
+POOL_SIZE = 8
+# Prepared statements kept per pooled connection (sqlite3 LRU statement cache)
+STATEMENT_CACHE_SIZE = 256
+# Applied to every connection: WAL, fewer fsyncs, in-memory temp tables,
+# 128MB page cache and 256MB of memory-mapped I/O
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-131072",
+    "PRAGMA mmap_size=268435456",
+]
+# INSERT ... RETURNING needs SQLite 3.35+
+SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# --- Endpoint SQL ---
+# Plain constant strings so every call hits the connection's statement cache.
+# Each read endpoint resolves the name and joins in one query; unknown names
+# are answered with a 404 from the in-memory name sets before any query runs.
+# Existence check + insert in one statement: no row back means the name is taken.
+# Only safe while idx_pokemon_name_norm is UNIQUE (see create_lookup_indexes)
+SQL_INSERT_POKEMON = """
+    INSERT INTO pokemon (name, type1_id, type2_id)
+    VALUES (?, ?, ?)
+    ON CONFLICT DO NOTHING
+    RETURNING id
+"""
+# Explicit existence check for when SQL_INSERT_POKEMON can't be used
+SQL_POKEMON_EXISTS = "SELECT 1 FROM pokemon WHERE name_norm = ? LIMIT 1"
+# Random trainer = first id at or after a random id in the cached [min, max] range
+SQL_TRAINER_FROM_ID = "SELECT id, name FROM trainers WHERE id >= ? ORDER BY id LIMIT 1"
+
+SQL_POKEMON_BY_ABILITY = """
+    SELECT DISTINCT p.name
+    FROM abilities a
+    INNER JOIN trainer_pokemon_abilities ta ON ta.ability_id = a.id
+    INNER JOIN pokemon p ON ta.pokemon_id = p.id
+    WHERE a.name_norm = ?
+    ORDER BY p.name
+"""
+
+SQL_POKEMON_BY_TYPE = """
+    SELECT DISTINCT p.name
+    FROM types t
+    INNER JOIN pokemon p ON p.type1_id = t.id OR p.type2_id = t.id
+    WHERE t.name_norm = ?
+    ORDER BY p.name
+"""
+
+SQL_TRAINERS_BY_POKEMON = """
+    SELECT DISTINCT t.name
+    FROM pokemon p
+    INNER JOIN trainer_pokemon_abilities ta ON ta.pokemon_id = p.id
+    INNER JOIN trainers t ON ta.trainer_id = t.id
+    WHERE p.name_norm = ?
+    ORDER BY t.name
+"""
+
+SQL_ABILITIES_BY_POKEMON = """
+    SELECT DISTINCT a.name
+    FROM pokemon p
+    INNER JOIN trainer_pokemon_abilities ta ON ta.pokemon_id = p.id
+    INNER JOIN abilities a ON ta.ability_id = a.id
+    WHERE p.name_norm = ?
+    ORDER BY a.name
+"""
 
 # --- Database Connection ---
-def connect_db() -> Optional[sqlite3.Connection]:
+def connect_db(**connect_kwargs) -> Optional[sqlite3.Connection]:
     """
     Task 1: Connect to the SQLite database.
     Implement the connection logic and return the connection object.
     Return None if connection fails.
+    Extra keyword arguments are passed through to sqlite3.connect().
     """
     if not os.path.exists(DB_NAME):
         print(f"Error: Database file '{DB_NAME}' not found.")
@@ -25,16 +109,105 @@ def connect_db() -> Optional[sqlite3.Connection]:
     connection = None
     try:
         # --- Implement Here ---
-        connection = sqlite3.connect(DB_NAME)
+        connection = sqlite3.connect(DB_NAME, **connect_kwargs)
+        for pragma in SQLITE_PRAGMAS:
+            connection.execute(pragma)
         connection.row_factory = sqlite3.Row
         # --- End Implementation ---
     except sqlite3.Error as e:
         print(f"Database connection error: {e}")
+        if connection is not None:
+            connection.close()
         return None
 
     return connection
 
 
+async def connect_api_db() -> aiosqlite.Connection:
+    """
+    Open a long-lived async connection for the API pool: autocommit
+    (transactions are opened explicitly) and tuned once up front.
+    """
+    connection = await aiosqlite.connect(
+        DB_NAME,
+        isolation_level=None,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    connection.row_factory = sqlite3.Row
+    for pragma in SQLITE_PRAGMAS:
+        await connection.execute(pragma)
+    return connection
+
+
+@asynccontextmanager
+async def pooled_conn(app: FastAPI):
+    """
+    Borrow a connection from the app pool and always hand it back,
+    rolling back anything left uncommitted.
+    """
+    pool = app.state.pool
+    conn = await pool.get()
+    try:
+        yield conn
+    finally:
+        try:
+            if conn.in_transaction:
+                await conn.rollback()
+        finally:
+            pool.put_nowait(conn)
+
+
+# --- PokeAPI ---
+# Runs of non-alphanumeric characters (as str.isalnum() sees them), for to_camel_case
+NON_ALNUM_RE = re.compile(r"[\W_]+")
+
+
+def to_camel_case(s: str) -> str:
+    """
+    Camel case a PokeAPI name to neaten it, e.g. 'mr-mime' -> 'mrMime'.
+    """
+    parts = NON_ALNUM_RE.sub(" ", s).split()
+    if not parts:
+        return ""
+    first, rest = parts[0].lower(), parts[1:]
+    return first + "".join(p.capitalize() for p in rest)
+
+
+async def fetch_pokeapi_pokemon(app: FastAPI, name: str) -> Optional[Tuple[str, List[str], List[str]]]:
+    """
+    Fetch a pokemon by normalized name from PokeAPI through the app's LRU/TTL cache.
+    Returns (name, ability names, type names) - only these are cached, not the full
+    record with its moves, sprites etc.
+    Returns None if PokeAPI doesn't know the name (cached for a shorter time);
+    network errors and other HTTP errors propagate and are not cached.
+    """
+    cache: OrderedDict = app.state.pokeapi_cache
+    now = time.monotonic()
+    hit = cache.get(name)
+    if hit and hit[0] > now:
+        cache.move_to_end(name)
+        return hit[1]
+
+    resp = await app.state.http.get(f"{POKEAPI_BASE}/{name}")
+    if resp.status_code == 404:
+        data, ttl = None, POKEAPI_MISS_TTL
+    else:
+        resp.raise_for_status()
+        record = resp.json()
+        data = (
+            record["name"],
+            [a["ability"]["name"] for a in record.get("abilities", []) if a.get("ability")],
+            [t["type"]["name"] for t in record.get("types", []) if t.get("type")],
+        )
+        ttl = POKEAPI_CACHE_TTL
+
+    cache[name] = (now + ttl, data)
+    cache.move_to_end(name)
+    if len(cache) > POKEAPI_CACHE_SIZE:
+        cache.popitem(last=False)
+    return data
+
+
 # --- Data Cleaning ---
 def clean_database(conn: sqlite3.Connection):
     """
@@ -94,20 +267,14 @@ def clean_database(conn: sqlite3.Connection):
 
         # quick safety check if table exist
         def table_exists(t):
-            cursor.execute(
-                "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
-                (t,)
-            )
-            return cursor.fetchone() is not None
+            return t in schema
 
         
         def get_id_and_name_cols(t):
 
             # Returns (id_col, name_col). Tries common patterns.
             
-            cursor.execute(f"PRAGMA table_info({t})")
-            cols = cursor.fetchall()
-            col_names = [c[1] for c in cols]
+            col_names = [c[1] for c in schema[t]]
 
             # id column
             id_candidates = [c for c in col_names if c.lower() in ("id", f"{t[:-1]}_id", f"{t}_id")]
@@ -125,31 +292,70 @@ def clean_database(conn: sqlite3.Connection):
             s = s.strip()
             # keep special cases like "Mr. Mime" or "Ho-Oh" reasonably intact:
             return " ".join(part.capitalize() for part in s.split())
-        
 
-        def remap_foreign_keys(base_table, old_id, new_id):
-            
-            # For any table referencing base_table, update FK values old_id -> new_id.
-            
-            for t in all_tables:
-                cursor.execute(f"PRAGMA foreign_key_list({t})")
-                fks = cursor.fetchall()
-                for fk in fks:
-                    # fk columns: (id, seq, table, from, to, on_update, on_delete, match)
-                    ref_table = fk[2]
-                    from_col = fk[3]
-                    to_col = fk[4]
-                    if ref_table == base_table and to_col:
-                        cursor.execute(
-                            f"UPDATE {t} SET {from_col}=? WHERE {from_col}=?",
-                            (new_id, old_id)
-                        )
+        # All misspellings as one compiled, case-insensitive alternation. It must match
+        # the whole (whitespace-padded) value - a substring substitution would turn
+        # the valid "Grass" into "Grasss" via "gras".
+        misspelling_re = re.compile(
+            r"\s*(" + "|".join(re.escape(k) for k in MISSPELLINGS) + r")\s*",
+            re.IGNORECASE
+        )
+
+        def normalize_name(s: str) -> str:
+            # Cleaned form of a name: known misspelling fix, else trimmed title case
+            if s is None:
+                return s
+            m = misspelling_re.fullmatch(s)
+            if m:
+                return MISSPELLINGS[m.group(1).lower()]
+            return title_case(s)
+
+        def remap_foreign_keys(base_table):
+
+            # For any table referencing base_table, update FK values old_id -> new_id
+            # for every pair in _remap - one UPDATE per referencing column.
+
+            for child_table, from_col in fk_refs.get(base_table, []):
+                cursor.execute(
+                    f"""
+                    UPDATE {child_table}
+                    SET {from_col} = (SELECT new_id FROM _remap WHERE old_id = {child_table}.{from_col})
+                    WHERE {from_col} IN (SELECT old_id FROM _remap)
+                    """
+                )
+
+        # Lets the cleaning UPDATE normalize every row inside SQLite
+        conn.create_function("normalize_name", 1, normalize_name, deterministic=True)
 
-                        
         # Find all tables once for FK remapping
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
         all_tables = [r[0] for r in cursor.fetchall()]
 
+        # Cache the schema once: PRAGMA table_info / foreign_key_list rows per table
+        schema = {t: cursor.execute(f"PRAGMA table_info({t})").fetchall() for t in all_tables}
+        fks = {t: cursor.execute(f"PRAGMA foreign_key_list({t})").fetchall() for t in all_tables}
+
+        # FK graph: referenced table -> [(child_table, from_col), ...]
+        fk_refs = {}
+        for child_table in all_tables:
+            for fk in fks[child_table]:
+                # fk columns: (id, seq, table, from, to, on_update, on_delete, match)
+                ref_table, from_col, to_col = fk[2], fk[3], fk[4]
+                if to_col:
+                    fk_refs.setdefault(ref_table, []).append((child_table, from_col))
+
+        # old_id -> new_id mapping for the duplicates of the table being cleaned
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS _remap (old_id INTEGER PRIMARY KEY, new_id INTEGER)")
+
+        # Take the write lock once; everything below commits together at the end
+        cursor.execute("BEGIN IMMEDIATE")
+
+        # The app's UNIQUE name_norm indexes would reject the in-between state (a fixed
+        # misspelling equals an existing name until its duplicate is merged below).
+        # Drop them here; the next app startup rebuilds them on the cleaned names.
+        for t in LOOKUP_TABLES:
+            cursor.execute(f"DROP INDEX IF EXISTS idx_{t}_name_norm")
+
         # Loop the target tables and and clean data
         for t in TARGET_TABLES:
             if not table_exists(t):
@@ -161,59 +367,40 @@ def clean_database(conn: sqlite3.Connection):
                 continue
 
             # 1) Standardize casing + strip whitespace + fix misspellings
-            cursor.execute(f"SELECT {id_col}, {name_col} FROM {t}")
-            rows = cursor.fetchall()
-            for row_id, raw_name in rows:
-                if raw_name is None:
-                    continue
-                cleaned = raw_name.strip()
-                key = cleaned.lower()
-                if key in MISSPELLINGS:
-                    cleaned = MISSPELLINGS[key]
-                else:
-                    cleaned = title_case(cleaned)
-
-                if cleaned != raw_name:
-                    cursor.execute(
-                        f"UPDATE {t} SET {name_col}=? WHERE {id_col}=?",
-                        (cleaned, row_id)
-                    )
-
-            # 2) Remove duplicates by name (keep lowest ID)
-            # We compare case-insensitively so "fire" and "Fire" collapse.
+            # One set-based UPDATE through normalize_name(). Unchanged rows are skipped.
             cursor.execute(
                 f"""
-                SELECT LOWER(TRIM({name_col})) AS nm, MIN({id_col}) AS keep_id
-                FROM {t}
+                UPDATE {t}
+                SET {name_col} = normalize_name({name_col})
                 WHERE {name_col} IS NOT NULL
-                GROUP BY LOWER(TRIM({name_col}))
-                HAVING COUNT(*) > 1
+                  AND {name_col} IS NOT normalize_name({name_col})
                 """
             )
-            dup_groups = cursor.fetchall()
 
-            for nm, keep_id in dup_groups:
-                # find all ids in this dup group except keep_id
-                cursor.execute(
-                    f"""
-                    SELECT {id_col}
+            # 2) Remove duplicates by name (keep lowest ID)
+            # We compare case-insensitively so "fire" and "Fire" collapse.
+            # Every duplicate id is mapped to its group's keep_id in one pass.
+            cursor.execute("DELETE FROM _remap")
+            cursor.execute(
+                f"""
+                INSERT INTO _remap (old_id, new_id)
+                SELECT d.{id_col}, g.keep_id
+                FROM {t} d
+                INNER JOIN (
+                    SELECT LOWER(TRIM({name_col})) AS nm, MIN({id_col}) AS keep_id
                     FROM {t}
-                    WHERE LOWER(TRIM({name_col})) = ?
-                      AND {id_col} <> ?
-                    """,
-                    (nm, keep_id)
-                )
-                dup_ids = [r[0] for r in cursor.fetchall()]
-
-                for dup_id in dup_ids:
-                    # remap foreign keys from dup_id -> keep_id
-                    remap_foreign_keys(t, dup_id, keep_id)
+                    WHERE {name_col} IS NOT NULL
+                    GROUP BY LOWER(TRIM({name_col}))
+                    HAVING COUNT(*) > 1
+                ) g ON LOWER(TRIM(d.{name_col})) = g.nm
+                WHERE d.{id_col} <> g.keep_id
+                """
+            )
 
-                if dup_ids:
-                    cursor.execute(
-                        f"DELETE FROM {t} WHERE {id_col} IN ({','.join('?' for _ in dup_ids)})",
-                        dup_ids
-                    )
+            if cursor.rowcount > 0:
+                # remap foreign keys from dup ids -> keep ids, then drop the dups
+                remap_foreign_keys(t)
+                cursor.execute(f"DELETE FROM {t} WHERE {id_col} IN (SELECT old_id FROM _remap)")
 
             ### remove_list: list[str] of values to delete wherever they appear.
 
@@ -227,13 +414,9 @@ def clean_database(conn: sqlite3.Connection):
             else:
                 try:
 
-                    # Inspect columns
-                    cursor.execute(f"PRAGMA table_info({t})")
-                    cols = cursor.fetchall()
-
                     # Pick likely text columns
                     text_cols = []
-                    for c in cols:
+                    for c in schema[t]:
                         col_name = c[1]
                         col_type = (c[2] or "").upper()
                         if ("CHAR" in col_type) or ("TEXT" in col_type) or ("CLOB" in col_type) or col_name.lower() in ("name", "type", "ability", "trainer", "pokemon_name"):
@@ -242,19 +425,19 @@ def clean_database(conn: sqlite3.Connection):
                     if not text_cols:
                         continue
 
-                    # For each text column, delete rows matching any bad value
-                    for col in text_cols:
-                        # Build: LOWER(TRIM(col)) IN (?, ?, ...)
-                        placeholders = ",".join("?" for _ in WORDS_TO_REMOVE_lower)
-                        sql = f"""
-                            DELETE FROM {t}
-                            WHERE {col} IS NOT NULL
-                              AND LOWER(TRIM({col})) IN ({placeholders})
-                        """
-                        cursor.execute(sql, WORDS_TO_REMOVE_lower)
+                    # One DELETE per table: a row goes if any text column matches a bad value
+                    # Build: LOWER(TRIM(col1)) IN (...) OR LOWER(TRIM(col2)) IN (...) ...
+                    where = " OR ".join(
+                        f"LOWER(TRIM({col})) IN (SELECT value FROM json_each(?))" for col in text_cols
+                    )
+                    cursor.execute(
+                        f"DELETE FROM {t} WHERE {where}",
+                        [json.dumps(WORDS_TO_REMOVE_lower)] * len(text_cols)
+                    )
 
                 except sqlite3.Error as e:
                     print(f"Removal step failed: {e}")
+                    conn.rollback()
                     return None
                 
         # --- End Implementation ---
@@ -266,6 +449,76 @@ def clean_database(conn: sqlite3.Connection):
         conn.rollback()  # Roll back changes on error
 
 
+# --- Lookup Indexes ---
+# SQLite's built-in LOWER() only folds ASCII letters
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def lookup_name(name: str) -> str:
+    """
+    Normalize a name to compare against the name_norm = LOWER(TRIM(name)) column:
+    strip all surrounding whitespace, then fold case the way SQLite's LOWER() does.
+    """
+    return name.strip().translate(ASCII_LOWER)
+
+
+def create_lookup_indexes(conn: sqlite3.Connection) -> set:
+    """
+    Add a generated name_norm = LOWER(TRIM(name)) column to each lookup table and
+    index it, so the endpoints compare plain indexed values instead of re-normalizing
+    every row, then index the join columns and refresh planner stats.
+    Returns the set of tables whose name_norm index is UNIQUE (i.e. their names are
+    clean); the others get a plain index, rebuilt as UNIQUE on a later call.
+    """
+    cursor = conn.cursor()
+    unique_tables = set()
+    try:
+        for t in LOOKUP_TABLES:
+            # index_list columns: (seq, name, unique, origin, partial)
+            unique_by_index = {r[1]: r[2] for r in cursor.execute(f"PRAGMA index_list({t})").fetchall()}
+            # table_xinfo (unlike table_info) lists generated columns
+            cursor.execute(f"PRAGMA table_xinfo({t})")
+            if "name_norm" not in [c[1] for c in cursor.fetchall()]:
+                # ALTER TABLE can only add VIRTUAL generated columns; the index stores the values
+                cursor.execute(
+                    f"ALTER TABLE {t} ADD COLUMN name_norm TEXT GENERATED ALWAYS AS (LOWER(TRIM(name))) VIRTUAL"
+                )
+            # Superseded by the name_norm index
+            cursor.execute(f"DROP INDEX IF EXISTS idx_{t}_lname")
+            if t in ("abilities", "types") and unique_by_index.get(f"idx_{t}_name") == 1:
+                # Case-sensitive UNIQUE(name) index earlier versions created for the upserts
+                cursor.execute(f"DROP INDEX idx_{t}_name")
+            if unique_by_index.get(f"idx_{t}_name_norm") == 0:
+                # Plain fallback index from a run on unclean data - try UNIQUE again
+                cursor.execute(f"DROP INDEX idx_{t}_name_norm")
+            try:
+                cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{t}_name_norm ON {t}(name_norm)")
+                unique_tables.add(t)
+            except sqlite3.IntegrityError as e:
+                print(f"WARNING: names in '{t}' are not unique (run clean_database first?): {e}")
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{t}_name_norm ON {t}(name_norm)")
+        # Junction columns the endpoint joins go through
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tpa_ability_id ON trainer_pokemon_abilities(ability_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tpa_pokemon_id ON trainer_pokemon_abilities(pokemon_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_pokemon_type1_id ON pokemon(type1_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_pokemon_type2_id ON pokemon(type2_id)")
+        cursor.execute("ANALYZE")
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Index creation failed: {e}")
+        conn.rollback()
+        return set()
+    return unique_tables
+
+
+def load_name_norms(conn: sqlite3.Connection, table: str) -> set:
+    """
+    Return the set of normalized (name_norm) names currently in table.
+    """
+    cursor = conn.execute(f"SELECT name_norm FROM {table} WHERE name_norm IS NOT NULL")
+    return {r[0] for r in cursor.fetchall()}
+
+
 # --- FastAPI Application ---
 def create_fastapi_app() -> FastAPI:
     """
@@ -273,11 +526,55 @@ def create_fastapi_app() -> FastAPI:
     Define the FastAPI app and include all the required endpoints below.
     """
     print("Creating FastAPI app and defining endpoints...")
-    app = FastAPI(title="Pokemon Assessment API")
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Make sure the name lookups below can use an index
+        conn = connect_db()
+        if not conn:
+            raise RuntimeError(f"Database file '{DB_NAME}' is not available.")
+        with closing(conn):
+            # Tables whose name_norm is guaranteed unique; the rest still hold duplicate names
+            app.state.unique_name_tables = create_lookup_indexes(conn)
+            if "pokemon" not in app.state.unique_name_tables:
+                print(
+                    "WARNING: idx_pokemon_name_norm is not UNIQUE - clean the database and restart. "
+                    "Until then new pokemon are checked for duplicates with an extra query."
+                )
+            # Known (normalized) names, so misses can 404 without touching the database
+            app.state.ability_names = load_name_norms(conn, "abilities")
+            app.state.type_names = load_name_norms(conn, "types")
+            app.state.pokemon_names = load_name_norms(conn, "pokemon")
+            # Trainer id range for picking a random trainer with an index lookup
+            app.state.trainer_id_range = tuple(conn.execute("SELECT MIN(id), MAX(id) FROM trainers").fetchone())
+
+        # Connections handed out to the endpoints by pooled_conn()
+        app.state.pool = asyncio.Queue()
+        try:
+            for _ in range(POOL_SIZE):
+                app.state.pool.put_nowait(await connect_api_db())
+            # One HTTP/2 client (and keep-alive pool) for all PokeAPI calls
+            app.state.http = httpx.AsyncClient(
+                http2=True,
+                timeout=10.0,
+                limits=httpx.Limits(max_keepalive_connections=32),
+            )
+            # name -> (expires_at, (name, abilities, types) or None), see fetch_pokeapi_pokemon()
+            app.state.pokeapi_cache = OrderedDict()
+            try:
+                yield
+            finally:
+                await app.state.http.aclose()
+        finally:
+            # Close whatever made it into the pool, even if startup failed part-way
+            while not app.state.pool.empty():
+                await app.state.pool.get_nowait().close()
+
+    app = FastAPI(title="Pokemon Assessment API", lifespan=lifespan)
 
     # --- Define Endpoints Here ---
     @app.get("/")
-    def read_root():
+    async def read_root():
         """
         Task 3: Basic root response message
         Return a simple JSON response object that contains a `message` key with any corresponding value.
@@ -289,7 +586,7 @@ def create_fastapi_app() -> FastAPI:
         # --- End Implementation ---
 
     @app.get("/pokemon/ability/{ability_name}", response_model=List[str])
-    def get_pokemon_by_ability(ability_name: str):
+    async def get_pokemon_by_ability(ability_name: str, request: Request):
         """
         Task 4: Retrieve all Pokémon names with a specific ability.
         Query the cleaned database. Handle cases where the ability doesn't exist.
@@ -301,47 +598,24 @@ def create_fastapi_app() -> FastAPI:
         
         if not ability_name or not ability_name.strip():
             raise HTTPException(status_code=400, detail="Ability name cannot be empty.")
-        conn = connect_db()
-        cur = conn.cursor()
-        abil = ability_name.strip()
-        
-        # 1) Find ability id (case-insensitive) - also check if the ability actually exists
-        cur.execute(
-            "SELECT id FROM abilities WHERE LOWER(TRIM(name)) = LOWER(TRIM(?))",
-            (abil,)
-        )
-        row = cur.fetchone()
-        if not row:
-            conn.close()
-            raise HTTPException(status_code=404, detail=f"Ability '{ability_name}' not found.")
+        abil = lookup_name(ability_name)
 
-        ability_id = row[0]
-        # Perform joins        
-        results: List[str] = []
-
-        # Simple group by to ensure no duplicate names
-        cur.execute(
-                    f"""
-                    SELECT p.name
-                    FROM  abilities a
-                    INNER JOIN trainer_pokemon_abilities ta ON ta.ability_id = a.id
-                    INNER JOIN pokemon p ON ta.pokemon_id = p.id
-                    WHERE a.id = ?
-                    GROUP BY p.name
-                    ORDER BY p.name
-                    """,
-                    (ability_id,)
-                )
+        # Unknown ability - 404 straight from the in-memory name set, no query needed
+        if abil not in request.app.state.ability_names:
+            raise HTTPException(status_code=404, detail=f"Ability '{ability_name}' not found.")
 
-        results = [r[0] for r in cur.fetchall()]
+        # Only now take a pooled connection: 400s and 404s above never wait on the pool.
+        # Resolve the ability (case-insensitive) and join in one query
+        async with pooled_conn(request.app) as conn:
+            rows = await conn.execute_fetchall(SQL_POKEMON_BY_ABILITY, (abil,))
+        results: List[str] = [r[0] for r in rows]
 
         # If ability exists but no pokemon reference it, return empty list (not an error)
-        conn.close()
         return results
         # --- End Implementation ---
 
     @app.get("/pokemon/type/{type_name}", response_model=List[str])
-    def get_pokemon_by_type(type_name: str):
+    async def get_pokemon_by_type(type_name: str, request: Request):
         """
         Task 5: Retrieve all Pokémon names of a specific type (considers type1 and type2).
         Query the cleaned database. Handle cases where the type doesn't exist.
@@ -349,54 +623,23 @@ def create_fastapi_app() -> FastAPI:
         # --- Implement here ---
         if not type_name or not type_name.strip():
             raise HTTPException(status_code=400, detail="Type name cannot be empty.")
-        conn = connect_db()
-        cur = conn.cursor()
-        type_ = type_name.strip()
-        
-        # 1) Find ty[e id (case-insensitive) - also check if the type actually exists
-        cur.execute(
-            "SELECT id FROM types WHERE LOWER(TRIM(name)) = LOWER(TRIM(?))",
-            (type_,)
-        )
-        row = cur.fetchone()
-        if not row:
-            conn.close()
-            raise HTTPException(status_code=404, detail=f"Type '{type_name}' not found.")
-
-        type_id = row[0]
-        # Perform joins        
-        results: List[str] = []
+        type_ = lookup_name(type_name)
 
-        # Simple group by to ensure no duplicate names
-        cur.execute(
-                    f"""
-                    	SELECT * 
-					FROM (
-					
-					SELECT p.name 
-					FROM types t
-					INNER JOIN pokemon p on p.type1_id=t.id
-					WHERE t.id=?
-					UNION
-					SELECT p.name 
-					FROM types t
-					INNER JOIN pokemon p on p.type2_id=t.id
-					WHERE t.id=?
-					) as t
-					GROUP BY name
-                    """,
-                    (type_id,type_id)  # feels redundant to pass the same parameter twice... But when in Rome...
-                )
+        # Unknown type - 404 straight from the in-memory name set, no query needed
+        if type_ not in request.app.state.type_names:
+            raise HTTPException(status_code=404, detail=f"Type '{type_name}' not found.")
 
-        results = [r[0] for r in cur.fetchall()]
+        # Resolve the type (case-insensitive) and join in one query
+        async with pooled_conn(request.app) as conn:
+            rows = await conn.execute_fetchall(SQL_POKEMON_BY_TYPE, (type_,))
+        results: List[str] = [r[0] for r in rows]
 
         # If type exists but no pokemon reference it, return empty list (not an error)
-        conn.close()
         return results
         # --- End Implementation ---
 
     @app.get("/trainers/pokemon/{pokemon_name}", response_model=List[str])
-    def get_trainers_by_pokemon(pokemon_name: str):
+    async def get_trainers_by_pokemon(pokemon_name: str, request: Request):
         """
         Task 6: Retrieve all trainer names who have a specific Pokémon.
         Query the cleaned database. Handle cases where the Pokémon doesn't exist or has no trainer.
@@ -405,47 +648,24 @@ def create_fastapi_app() -> FastAPI:
         
         if not pokemon_name or not pokemon_name.strip():
             raise HTTPException(status_code=400, detail="Pokemon name cannot be empty.")
-        conn = connect_db()
-        cur = conn.cursor()
-        pokemon_name_ = pokemon_name.strip()
-        
-        # 1) Find ty[e id (case-insensitive) - also check if the pokemon actually exists
-        cur.execute(
-            "SELECT id FROM pokemon WHERE LOWER(TRIM(name)) = LOWER(TRIM(?))",
-            (pokemon_name_,)
-        )
-        row = cur.fetchone()
-        if not row:
-            conn.close()
-            raise HTTPException(status_code=404, detail=f"Pokemon '{pokemon_name}' not found.")
-
-        pokemon_id = row[0]
-        # Perform joins        
-        results: List[str] = []
+        pokemon_name_ = lookup_name(pokemon_name)
 
-        # Simple group by to ensure no duplicate names
-        cur.execute(
-                    f"""
-					SELECT t.name 
-					FROM pokemon p
-					INNER JOIN trainer_pokemon_abilities ta on ta.pokemon_id=p.id
-					INNER JOIN trainers t on ta.trainer_id=t.id
-					WHERE p.id=?
-					GROUP BY t.name
-                    """,
-                    (pokemon_id,) 
-                )
+        # Unknown pokemon - 404 straight from the in-memory name set, no query needed
+        if pokemon_name_ not in request.app.state.pokemon_names:
+            raise HTTPException(status_code=404, detail=f"Pokemon '{pokemon_name}' not found.")
 
-        results = [r[0] for r in cur.fetchall()]
+        # Resolve the pokemon (case-insensitive) and join in one query
+        async with pooled_conn(request.app) as conn:
+            rows = await conn.execute_fetchall(SQL_TRAINERS_BY_POKEMON, (pokemon_name_,))
+        results: List[str] = [r[0] for r in rows]
 
         # If pokemon exists but no trainer reference it, return empty list (not an error)
-        conn.close()
         return results
 
         # --- End Implementation ---
 
     @app.get("/abilities/pokemon/{pokemon_name}", response_model=List[str])
-    def get_abilities_by_pokemon(pokemon_name: str):
+    async def get_abilities_by_pokemon(pokemon_name: str, request: Request):
         """
         Task 7: Retrieve all ability names of a specific Pokémon.
         Query the cleaned database. Handle cases where the Pokémon doesn't exist.
@@ -454,73 +674,33 @@ def create_fastapi_app() -> FastAPI:
 
         if not pokemon_name or not pokemon_name.strip():
             raise HTTPException(status_code=400, detail="Pokemon name cannot be empty.")
-        conn = connect_db()
-        cur = conn.cursor()
-        pokemon_name_ = pokemon_name.strip()
-        
-        # 1) Find ty[e id (case-insensitive) - also check if the pokemon actually exists
-        cur.execute(
-            "SELECT id FROM pokemon WHERE LOWER(TRIM(name)) = LOWER(TRIM(?))",
-            (pokemon_name_,)
-        )
-        row = cur.fetchone()
-        if not row:
-            conn.close()
-            raise HTTPException(status_code=404, detail=f"Pokemon '{pokemon_name}' not found.")
-
-        pokemon_id = row[0]
-        # Perform joins        
-        results: List[str] = []
+        pokemon_name_ = lookup_name(pokemon_name)
 
-        # Simple group by to ensure no duplicate names
-        cur.execute(
-                    f"""
-					SELECT a.name 
-					FROM pokemon p
-					INNER JOIN trainer_pokemon_abilities ta on ta.pokemon_id=p.id
-					INNER JOIN abilities a on ta.ability_id=a.id
-					WHERE p.id=?
-					GROUP BY a.name
-                    """,
-                    (pokemon_id,) 
-                )
+        # Unknown pokemon - 404 straight from the in-memory name set, no query needed
+        if pokemon_name_ not in request.app.state.pokemon_names:
+            raise HTTPException(status_code=404, detail=f"Pokemon '{pokemon_name}' not found.")
 
-        results = [r[0] for r in cur.fetchall()]
+        # Resolve the pokemon (case-insensitive) and join in one query
+        async with pooled_conn(request.app) as conn:
+            rows = await conn.execute_fetchall(SQL_ABILITIES_BY_POKEMON, (pokemon_name_,))
+        results: List[str] = [r[0] for r in rows]
 
         # If pokemon exists but no ability reference it, return empty list (not an error)
-        conn.close()
         return results
         # --- End Implementation ---
 
     # --- Implement Task 8 here ---
     # API to Create New Pokemon in DB
     @app.post("/pokemon/create/{pokemon_name}")
-    async def create_pokemon(pokemon_name: str):
+    async def create_pokemon(pokemon_name: str, request: Request):
         if not pokemon_name or not pokemon_name.strip():
             raise HTTPException(status_code=400, detail="Pokemon name cannot be empty.")
         
-        pokemon_name_ = pokemon_name.strip().lower()
-        conn = connect_db()
-        cur = conn.cursor()
-       # 1) Check if pokemon exists
-        cur.execute(
-            "SELECT id FROM pokemon WHERE LOWER(TRIM(name)) = LOWER(TRIM(?))",
-            (pokemon_name_,)
-        )
-
-
-        # Camel case function to neaten API name
-        def to_camel_case(s: str) -> str:
-            s = "".join(ch if ch.isalnum() else " " for ch in s)
-            parts = [p for p in s.split() if p]
-            if not parts:
-                return ""
-            first, rest = parts[0].lower(), parts[1:]
-            return first + "".join(p.capitalize() for p in rest)
-
-        row = cur.fetchone()
-        if row:
-            conn.close()
+        pokemon_name_ = lookup_name(pokemon_name)
+        # 1) Check if pokemon exists - cheap in-memory check so known names skip PokeAPI;
+        #    the insert below is the authoritative check
+        existing = pokemon_name_ in request.app.state.pokemon_names
+        if existing:
             raise HTTPException(status_code=409, detail=f"Pokemon '{pokemon_name}' already exists in db.")
 
         # we dont have the Pokemon in DB- get the details
@@ -528,151 +708,135 @@ def create_fastapi_app() -> FastAPI:
         # 2) Fetch pokemon from PokeAPI
         # ----------------------------
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                resp = await client.get(f"{POKEAPI_BASE}/{pokemon_name_}")
+            data = await fetch_pokeapi_pokemon(request.app, pokemon_name_)
         except httpx.RequestError:
-            conn.close()
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="PokeAPI is unreachable"
             )
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"PokeAPI error ({e.response.status_code})"
+            )
 
-        if resp.status_code == 404:
-            conn.close()
+        if data is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Pokemon '{pokemon_name}' not identified"
             )
-        if resp.status_code >= 400:
-            conn.close()
-            raise HTTPException(
-                status_code=status.HTTP_502_BAD_GATEWAY,
-                detail=f"PokeAPI error ({resp.status_code})"
-            )
-
-        data = resp.json()
 
         # ----------------------------
         # 3) Extract relevant data
         # ----------------------------
-        api_pokemon_id: int = data["id"]
-        display_name: str = data["name"]
+        # name, abilities list and types list from api
+        display_name, api_abilities, api_types = data
 
         display_name = to_camel_case(display_name)
 
-        # abilities list from api
-        api_abilities: List[str] = [
-            a["ability"]["name"]
-            for a in data.get("abilities", [])
-            if a.get("ability")
-        ]
-        # types list from api
-        api_types: List[str] = [
-            t["type"]["name"]
-            for t in data.get("types", [])
-            if t.get("type")
-        ]
+        ability_names = [to_camel_case(a) for a in api_abilities]
+        type_names = [to_camel_case(t) for t in api_types[:2]]  # only first two types matter
 
         # Get a random trainer ready for later
-        cur.execute("SELECT id,name FROM trainers ORDER BY RANDOM() LIMIT 1")
-        row = cur.fetchone()
-        if not row:
+        min_trainer_id, max_trainer_id = request.app.state.trainer_id_range
+        if max_trainer_id is None:
             raise Exception("No trainers in DB")
-        random_trainer_id = row[0]
-        random_trainer_name = row[1]
-        
-        cur.execute(
-            """
-            INSERT INTO pokemon (name, type1_id, type2_id)
-            VALUES (?, NULL, NULL)
-            """,
-            (display_name,)
-        )
-        new_pokemon_id = cur.lastrowid
-        print(f"Created new pokemon ID {new_pokemon_id}")
-
-        # For each ability - check is it in db? No-Add - Assign ID to new pokemon
-        for ab_name in api_abilities:
-            # 1) check if ability exists
-            cur.execute(
-                """
-                SELECT id FROM abilities
-                WHERE name = ?
-                LIMIT 1
-                """,
-                (to_camel_case(ab_name),)
-            )
-            row = cur.fetchone()
-
-            if row:
-                ability_id = row[0]
-            else:
-                # 2) insert ability if missing
-                cur.execute(
-                    """
-                    INSERT INTO abilities (name)
-                    VALUES (?)
-                    """,
-                    (to_camel_case(ab_name),)
-                )
-                ability_id = cur.lastrowid
 
-            # 3) link ability to pokemon in junction table
-            # (adjust column names if yours differ)
-            cur.execute(
-                """
-                INSERT INTO trainer_pokemon_abilities (pokemon_id, ability_id, trainer_id)
-                VALUES (?, ?, ?)
-                """,
-                (new_pokemon_id, ability_id, random_trainer_id)
+        # Only take a pooled connection once PokeAPI has answered, so slow fetches
+        # don't hold connections the read endpoints are waiting for
+        async with pooled_conn(request.app) as conn:
+            rows = await conn.execute_fetchall(
+                SQL_TRAINER_FROM_ID, (random.randint(min_trainer_id, max_trainer_id),)
             )
-
-        # Resolve up to two type IDs
-        type_ids: List[int] = []
-        
-        for t_name in api_types[:2]:  # only first two types matter
-            # 1) check if type exists
-            cur.execute(
+            if not rows:
+                # The trainers at the top of the range are gone - start from the lowest id
+                rows = await conn.execute_fetchall(SQL_TRAINER_FROM_ID, (min_trainer_id,))
+            if not rows:
+                raise Exception("No trainers in DB")
+            random_trainer_id = rows[0][0]
+            random_trainer_name = rows[0][1]
+
+            async def resolve_name_ids(table: str, names: List[str]) -> dict:
+                # name -> id for every name (matched on name_norm): one SELECT for all of them,
+                # plus one executemany + re-SELECT only if some are missing
+                by_norm = {}
+                for n in names:
+                    by_norm.setdefault(lookup_name(n), n)
+                if not by_norm:
+                    return {}
+                # The names travel as one JSON array so the SQL text is the same for any count
+                norms_json = json.dumps(list(by_norm))
+                select_sql = f"""
+                    SELECT name_norm, id FROM {table}
+                    WHERE name_norm IN (SELECT value FROM json_each(?))
+                    ORDER BY id
                 """
-                SELECT id FROM types
-                WHERE name = ?
-                LIMIT 1
-                """,
-                (to_camel_case(t_name),)
-            )
-            row = cur.fetchone()
-
-            if row:
-                t_id = row[0]
-            else:
-                # 2) insert type if missing
-                cur.execute(
+                ids = {}
+                for norm, row_id in await conn.execute_fetchall(select_sql, (norms_json,)):
+                    ids.setdefault(norm, row_id)
+                missing = [n for norm, n in by_norm.items() if norm not in ids]
+                if missing:
+                    # Runs under the BEGIN IMMEDIATE write lock, so no other writer can add
+                    # these names between the SELECT above and this INSERT
+                    await conn.executemany(f"INSERT INTO {table} (name) VALUES (?)", [(n,) for n in missing])
+                    for norm, row_id in await conn.execute_fetchall(select_sql, (norms_json,)):
+                        ids.setdefault(norm, row_id)
+                return {n: ids[lookup_name(n)] for n in names}
+
+            # All inserts below commit (or roll back) together. IMMEDIATE takes the write lock
+            # up front so concurrent creates queue up instead of failing on a stale read snapshot
+            await conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Resolve up to two type IDs (inserting missing types)
+                type_id_by_name = await resolve_name_ids("types", type_names)
+                type_ids: List[int] = [type_id_by_name[n] for n in type_names]
+
+                # Pad if only 0 or 1 type
+                type1_id: Optional[int] = type_ids[0] if len(type_ids) > 0 else None
+                type2_id: Optional[int] = type_ids[1] if len(type_ids) > 1 else None
+
+                new_pokemon_id: Optional[int] = None
+                if SQLITE_HAS_RETURNING and "pokemon" in request.app.state.unique_name_tables:
+                    rows = await conn.execute_fetchall(SQL_INSERT_POKEMON, (display_name, type1_id, type2_id))
+                    if rows:
+                        new_pokemon_id = rows[0][0]
+                else:
+                    # No RETURNING, or ON CONFLICT can't fire without the UNIQUE index: check
+                    # explicitly - the write lock taken above keeps check and insert atomic
+                    rows = await conn.execute_fetchall(SQL_POKEMON_EXISTS, (lookup_name(display_name),))
+                    if not rows:
+                        cur = await conn.execute(
+                            """
+                            INSERT INTO pokemon (name, type1_id, type2_id)
+                            VALUES (?, ?, ?)
+                            """,
+                            (display_name, type1_id, type2_id)
+                        )
+                        new_pokemon_id = cur.lastrowid
+                if new_pokemon_id is None:
+                    # PokeAPI's canonical name already exists
+                    raise HTTPException(status_code=409, detail=f"Pokemon '{pokemon_name}' already exists in db.")
+                print(f"Created new pokemon ID {new_pokemon_id}")
+
+                # Resolve ability IDs (inserting missing abilities) and link them all to the new pokemon
+                ability_id_by_name = await resolve_name_ids("abilities", ability_names)
+                await conn.executemany(
                     """
-                    INSERT INTO types (name)
-                    VALUES (?)
+                    INSERT INTO trainer_pokemon_abilities (pokemon_id, ability_id, trainer_id)
+                    VALUES (?, ?, ?)
                     """,
-                    (to_camel_case(t_name),)
+                    [(new_pokemon_id, ability_id_by_name[n], random_trainer_id) for n in ability_names]
                 )
-                t_id = cur.lastrowid
-
-            type_ids.append(t_id)
-
-        # Pad if only 0 or 1 type
-        type1_id: Optional[int] = type_ids[0] if len(type_ids) > 0 else None
-        type2_id: Optional[int] = type_ids[1] if len(type_ids) > 1 else None
-
-        # Update pokemon row with type1_id/type2_id
-        cur.execute(
-            """
-            UPDATE pokemon
-            SET type1_id = ?, type2_id = ?
-            WHERE id = ?
-            """,
-            (type1_id, type2_id, new_pokemon_id)
-        )
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+
+        # Keep the in-memory name sets in step with what was just committed
+        request.app.state.pokemon_names.add(lookup_name(display_name))
+        request.app.state.type_names.update(lookup_name(n) for n in type_names)
+        request.app.state.ability_names.update(lookup_name(n) for n in ability_names)
 
-        conn.commit()
-        conn.close()
         return {"message": f"Successfully created Pokemon {pokemon_name} who has been trained by {random_trainer_name}"}
     # --- End Implementation ---
 
@@ -685,8 +849,8 @@ if __name__ == "__main__":
     # Ensure data is cleaned before running the app for testing
     temp_conn = connect_db()
     if temp_conn:
-        clean_database(temp_conn)
-        temp_conn.close()
+        with closing(temp_conn):
+            clean_database(temp_conn)
 
     app_instance = create_fastapi_app()
     uvicorn.run(app_instance, host="127.0.0.1", port=8000)